@@ -1,31 +1,47 @@
 import discord
 from discord.ext import commands
 import asyncio
+import atexit
 import os
+import pathlib
 import aiohttp
 import random
 import csv
 import datetime
 import json
+import re
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
-# Gemini API Library
-from google import genai
-from google.genai.types import GenerateContentConfig, ThinkingConfig
+# Optional faster event loop (not available on Windows)
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# Optional faster JSON encoder for LM Studio requests
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # --- Configuration ---
 # Get the directory of the executable file
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = pathlib.Path(__file__).resolve().parent
 
+@lru_cache(maxsize=None)
 def read_credential(filename):
     try:
-        with open(os.path.join(BASE_DIR, filename), 'r', encoding='utf-8') as f:
+        with open(BASE_DIR / filename, 'r', encoding='utf-8') as f:
             return f.read().strip()
     except FileNotFoundError:
         print(f"Error: {filename} not found.")
         return ""
 
-TOKEN = read_credential("discord_token.txt")
-GEMINI_API_KEY = read_credential("gemini_api_key.txt")
+# Environment variables take precedence over the credential files (e.g. for container deployments)
+TOKEN = os.environ.get("DISCORD_TOKEN") or read_credential("discord_token.txt")
+GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY") or read_credential("gemini_api_key.txt")
 
 # --- LM Studio Settings ---
 ENABLE_COMPARISON = False  # Set to True to enable A/B testing
@@ -38,15 +54,27 @@ LM_MODEL_PARAMS = {
     "google/gemma-3-4b": {"temperature": 1.0, "top_p": 0.95},
 }
 
-# Lock for serializing LM Studio processing (VRAM conservation)
-lm_lock = asyncio.Lock()
+# Request payload fields per model, built once; "messages" is added per request
+LM_PAYLOAD_BASE = {model: {"model": model, **params} for model, params in LM_MODEL_PARAMS.items()}
+LM_DEFAULT_PARAMS = {"temperature": 0.7, "top_p": 0.9}
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Number of LM Studio queries allowed to run at once. Keep 1 to serialize them (VRAM conservation)
+# or raise it when all models fit in VRAM together
+LM_CONCURRENCY = int(os.getenv("LM_CONCURRENCY", "1"))
+lm_semaphore = asyncio.Semaphore(LM_CONCURRENCY)
+
+# Optional pause after each LM Studio query before the next model may start (e.g. to let VRAM be released)
+LM_COOLDOWN_SEC = float(os.getenv("LM_COOLDOWN_SEC", "0"))
 
 # Log file for comparison results
 COMPARISON_LOG_FILE = "comparison_log.csv"
+COMPARISON_LOG_PATH = BASE_DIR / COMPARISON_LOG_FILE
 
-# Initialize log file with header if it doesn't exist
-if not os.path.exists(os.path.join(BASE_DIR, COMPARISON_LOG_FILE)):
-    with open(os.path.join(BASE_DIR, COMPARISON_LOG_FILE), 'w', newline='', encoding='utf-8') as f:
+# Initialize log file with header if it doesn't exist or is empty
+COMPARISON_LOG_PATH.touch(exist_ok=True)
+if COMPARISON_LOG_PATH.stat().st_size == 0:
+    with open(COMPARISON_LOG_PATH, 'w', newline='', encoding='utf-8') as f:
         writer = csv.writer(f)
         writer.writerow(["Timestamp", "SourceChannelID", "MessageID", "ModelA", "ModelB", "Selected", "WinnerModel"])
 
@@ -58,118 +86,445 @@ CHANNEL_JA_EN_PAIRS = {
 # Reverse mapping for English to Japanese
 CHANNEL_EN_JA = {v: k for k, v in CHANNEL_JA_EN_PAIRS.items()}
 
-# Mapping (channel_id, message_id) -> target Discord message object
-forward_map = {}
+# Routing table: source channel_id -> (target channel_id, target language)
+# The target language is "en" or "ja"; self-mapped channels use "auto" and translate both ways
+CHANNEL_ROUTES = {source: (target, "ja") for source, target in CHANNEL_EN_JA.items()}
+CHANNEL_ROUTES.update({source: (target, "auto" if source == target else "en") for source, target in CHANNEL_JA_EN_PAIRS.items()})
+
+class LRUDict(OrderedDict):
+    """OrderedDict that evicts its least recently used entries once it holds more than maxsize items."""
+    def __init__(self, maxsize: int):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.maxsize:
+            self.popitem(last=False)
 
-# Conversation history: keeps the last 10 messages for each target channel
+# Mapping (channel_id, message_id) -> (channel_id, message_id) of the linked message
+# Older messages are evicted and no longer have their edits/deletions synced
+FORWARD_MAP_SIZE = 10000
+forward_map = LRUDict(maxsize=FORWARD_MAP_SIZE)
+
+# Conversation history: keeps the last CONVERSATION_HISTORY_SIZE (message_id, line) entries for each routed channel
+CONVERSATION_HISTORY_SIZE = 10
 conversation_memory = {}
 
-gemini_client = genai.Client(api_key=GEMINI_API_KEY, http_options={'api_version': 'v1alpha'})
-async_client = gemini_client.aio
+# Maximum length of the conversation context sent with each translation, and of each message within it
+CONTEXT_MAX_CHARS = 500
+MEMORY_LINE_MAX_CHARS = 300
+
+# Joined context string per channel; invalidated whenever its history changes
+context_cache = {}
+
+# Translation caches per target language: normalized text -> Future resolving to the translated text
+# Keyed on the text alone: the context changes with every message, so including it would defeat the cache
+TRANSLATION_CACHE_SIZE = 512
+translation_caches = {
+    "en": LRUDict(maxsize=TRANSLATION_CACHE_SIZE),
+    "ja": LRUDict(maxsize=TRANSLATION_CACHE_SIZE),
+}
+
+class RateLimiter:
+    """Token bucket allowing max_rate requests per time_period, with bursts of up to max_rate. 0 disables it."""
+    def __init__(self, max_rate: float, time_period: float = 60):
+        self.max_rate = max_rate
+        self.refill_rate = max_rate / time_period
+        self.tokens = max_rate
+        self.updated = None
+
+    async def __aenter__(self):
+        if self.max_rate <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if self.updated is not None:
+                self.tokens = min(self.max_rate, self.tokens + (now - self.updated) * self.refill_rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.refill_rate)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+# Maximum number of concurrent Gemini requests; the rest wait for a free slot
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "8"))
+gemini_semaphore = asyncio.Semaphore(GEMINI_CONCURRENCY)
+
+# Gemini requests per minute, smoothing bursts to the API quota (0 disables the limit)
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "60"))
+gemini_limiter = RateLimiter(GEMINI_RPM, 60)
+
+GEMINI_MODEL = "gemini-3-flash-preview"
+ENABLE_STREAMING = False  # Set to True to show Gemini translations progressively while they are generated
+
+# Gemini client, created on first use so the SDK isn't imported at startup
+gemini_client = None
+
+def get_gemini():
+    """Returns the async Gemini client, importing the SDK and creating the client on first use."""
+    global gemini_client
+    if gemini_client is None:
+        from google import genai
+        gemini_client = genai.Client(api_key=GEMINI_API_KEY, http_options={'api_version': 'v1alpha'})
+    return gemini_client.aio
+
+@lru_cache(maxsize=None)
+def translation_config():
+    """Returns the shared generation settings; callers copy it to set system_instruction."""
+    from google.genai.types import GenerateContentConfig, ThinkingConfig
+    return GenerateContentConfig(
+        temperature=0,
+        candidate_count=1,
+        thinking_config=ThinkingConfig(include_thoughts=False)
+    )
+
+# Hiragana, Katakana and CJK Unified Ideographs
+JAPANESE_RE = re.compile(r'[\u3040-\u30ff\u4e00-\u9faf]')
 
 def is_japanese(text: str) -> bool:
     """Checks if the text contains Japanese characters."""
-    for ch in text:
-        if ('\u3040' <= ch <= '\u30ff') or ('\u4e00' <= ch <= '\u9faf'):
-            return True
-    return False
+    # Most English messages are pure ASCII and can skip the regex scan
+    if text.isascii():
+        return False
+    return JAPANESE_RE.search(text) is not None
+
+# Discord mentions, custom, :shortcode: and Unicode emojis and URLs are forwarded as is
+UNTRANSLATABLE_RE = re.compile(r'<(?:@[!&]?\d+|#\d+|a?:\w+:\d+)>|:\w+:|https?://\S+|[\U0001F000-\U0001FFFF\u2600-\u27BF\uFE0F\u200D]')
+WORD_RE = re.compile(r'\w')
+URL_RE = re.compile(r'https?://\S+')
+
+def needs_translation(text: str) -> bool:
+    """Checks if the text has anything to translate besides mentions, emojis, URLs, punctuation and single characters."""
+    remainder = UNTRANSLATABLE_RE.sub("", text).strip()
+    return len(remainder) >= 2 and WORD_RE.search(remainder) is not None
+
+# A reply that is entirely one code block, and the "Translation:" prefix the model occasionally adds
+WRAPPING_FENCE_RE = re.compile(r'\A\s*```[\w-]*\n(.*?)\n?```\s*\Z', re.DOTALL)
+TRANSLATION_PREFIX_RE = re.compile(r'\A\s*Translation:\s*')
+
+def clean_response(text: str, source: str = "") -> str:
+    """Strips a code fence wrapping the whole reply and a "Translation:" prefix, unless the source itself had them."""
+    text = (text or "").strip()
+    match = WRAPPING_FENCE_RE.match(text)
+    if match and "```" not in match.group(1) and not source.lstrip().startswith("```"):
+        text = match.group(1)
+    if not TRANSLATION_PREFIX_RE.match(source):
+        text = TRANSLATION_PREFIX_RE.sub("", text)
+    return text.strip()
+
+def format_memory_line(message: discord.Message) -> str:
+    """Formats a message as a line of conversation history, without URLs and capped at MEMORY_LINE_MAX_CHARS."""
+    content = URL_RE.sub('', message.content).strip()[:MEMORY_LINE_MAX_CHARS]
+    return f"{message.author.display_name}: {content}"
+
+def remember_message(message: discord.Message):
+    """Appends a message to the conversation history of its channel."""
+    channel_id = message.channel.id
+    conversation_memory.setdefault(channel_id, deque(maxlen=CONVERSATION_HISTORY_SIZE)).append((message.id, format_memory_line(message)))
+    context_cache.pop(channel_id, None)
+
+def update_remembered_message(message: discord.Message):
+    """Replaces the history entry of an edited message, if it is still in the window."""
+    messages = conversation_memory.get(message.channel.id, ())
+    for index, (message_id, _) in enumerate(messages):
+        if message_id == message.id:
+            messages[index] = (message_id, format_memory_line(message))
+            context_cache.pop(message.channel.id, None)
+            return
 
 def get_conversation_context(channel_id: int) -> str:
-    """Returns the conversation history for a specific channel."""
-    messages = conversation_memory.get(channel_id, [])
-    return "\n".join(messages)
+    """Returns the most recent conversation history for a specific channel, capped at CONTEXT_MAX_CHARS."""
+    context = context_cache.get(channel_id)
+    if context is not None:
+        return context
+    messages = conversation_memory.get(channel_id, ())
+    context = "\n".join(line for _, line in messages)
+    if len(context) > CONTEXT_MAX_CHARS:
+        # Keep the latest lines and drop the one cut in half
+        context = context[-CONTEXT_MAX_CHARS:]
+        context = context.partition("\n")[2] or context
+    context_cache[channel_id] = context
+    return context
+
+# --- Gemini Translation ---
+TARGET_LANGUAGES = {"en": "English", "ja": "Japanese"}
 
-async def translate_to_english(text: str, context: str = "") -> str:
-    """Translates Japanese text to English using Gemini."""
-    system_instruction = (
+# Translator prompts; only {context} is filled in per request. The source language is the other entry of TARGET_LANGUAGES.
+TRANSLATION_PROMPTS = {
+    target: (
         "You are a professional translator. Follow the instructions below.\n\n"
         "### Conversation Context (DO NOT TRANSLATE):\n"
         "The following content is for reference only. Do not translate this content or include it in the output.\n"
-        f"--- CONTEXT START ---\n{context}\n--- CONTEXT END ---\n\n"
+        "--- CONTEXT START ---\n{context}\n--- CONTEXT END ---\n\n"
         "### Translation Instructions:\n"
-        "Translate the input Japanese text into English accurately while preserving its original nuance and meaning.\n"
+        f"Translate the input {source} text into {language} accurately while preserving its original nuance and meaning.\n"
         "Do not translate Discord emojis or mentions (e.g., :smile: or @username); output them as is.\n"
         "Output ONLY the translated text without any preamble."
     )
-    response = await async_client.models.generate_content(
-        model="gemini-3-flash-preview",
-        contents=text,
-        config=GenerateContentConfig(
-            system_instruction=system_instruction,
-            temperature=0,
-            candidate_count=1,
-            thinking_config=ThinkingConfig(include_thoughts=False)
+    for target, language in TARGET_LANGUAGES.items()
+    for source in (name for other, name in TARGET_LANGUAGES.items() if other != target)
+}
+
+def translation_request(text: str, target: str, context: str, strict: bool = False):
+    """Returns the (contents, config) pair for translating text into the target language."""
+    system_instruction = TRANSLATION_PROMPTS[target].format(context=context)
+    if strict:
+        system_instruction += f"\nOutput ONLY in {TARGET_LANGUAGES[target]}."
+    return text, translation_config().model_copy(update={"system_instruction": system_instruction})
+
+async def translate(text: str, target: str, context: str = "", strict: bool = False) -> str:
+    """Translates text into the target language ("en" or "ja") using Gemini."""
+    contents, config = translation_request(text, target, context, strict)
+    async with gemini_limiter, gemini_semaphore:
+        response = await get_gemini().models.generate_content(
+            model=GEMINI_MODEL,
+            contents=contents,
+            config=config
         )
-    )
-    return response.text.strip()
+    return clean_response(response.text, text)
+
+async def translate_stream(text: str, target: str, context: str, on_progress) -> str:
+    """Streams a translation from Gemini, passing the text received so far to on_progress after each chunk."""
+    contents, config = translation_request(text, target, context)
+    received = ""
+    async with gemini_limiter, gemini_semaphore:
+        stream = await get_gemini().models.generate_content_stream(
+            model=GEMINI_MODEL,
+            contents=contents,
+            config=config
+        )
+        async for chunk in stream:
+            if chunk.text:
+                received += chunk.text
+                on_progress(received)
+    return received
+
+# --- Batch Translation ---
+# Messages arriving within BATCH_WINDOW seconds are translated in a single request
+BATCH_WINDOW = 0.15
+BATCH_MAX_SIZE = 8
 
-async def translate_to_japanese(text: str, context: str = "") -> str:
-    """Translates English text to Japanese using Gemini."""
-    system_instruction = (
+TRANSLATION_ERRORS = {"en": "Translation error.", "ja": "Translation error (JP)."}
+
+# (target language, source channel ID) -> queue of (text, context, future); created in setup_hook.
+# Batches never span channels, so one channel's conversation is never sent as another's context.
+translation_queues = {}
+
+BATCH_PROMPTS = {
+    target: (
         "You are a professional translator. Follow the instructions below.\n\n"
         "### Conversation Context (DO NOT TRANSLATE):\n"
         "The following content is for reference only. Do not translate this content or include it in the output.\n"
-        f"--- CONTEXT START ---\n{context}\n--- CONTEXT END ---\n\n"
+        "--- CONTEXT START ---\n{context}\n--- CONTEXT END ---\n\n"
         "### Translation Instructions:\n"
-        "Translate the input English text into Japanese accurately while preserving its original nuance and meaning.\n"
+        f"Each input item starts with a marker such as [1]. Translate every item into {language} accurately "
+        "while preserving its original nuance and meaning.\n"
         "Do not translate Discord emojis or mentions (e.g., :smile: or @username); output them as is.\n"
-        "Output ONLY the translated text without any preamble."
+        "Output each translation after its original marker, in the same order, without any preamble."
     )
-    response = await async_client.models.generate_content(
-        model="gemini-3-flash-preview",
-        contents=text,
-        config=GenerateContentConfig(
-            system_instruction=system_instruction,
-            temperature=0,
-            candidate_count=1,
-            thinking_config=ThinkingConfig(include_thoughts=False)
+    for target, language in TARGET_LANGUAGES.items()
+}
+
+# Matches the "[n]" markers that delimit items in a batch response
+BATCH_ITEM_RE = re.compile(r'^\[(\d+)\][ \t]*', re.MULTILINE)
+
+def merge_contexts(contexts: list) -> str:
+    """Merges overlapping conversation contexts, keeping the first occurrence of each line."""
+    lines = OrderedDict()
+    for context in contexts:
+        for line in context.split("\n"):
+            if line:
+                lines[line] = None
+    return "\n".join(lines)
+
+async def batch_translate(texts: list, context: str, target: str) -> list:
+    """Translates several texts with one Gemini request. Returns None if the reply cannot be split."""
+    system_instruction = BATCH_PROMPTS[target].format(context=context)
+    numbered = "\n".join(f"[{i}] {text}" for i, text in enumerate(texts, 1))
+    async with gemini_limiter, gemini_semaphore:
+        response = await get_gemini().models.generate_content(
+            model=GEMINI_MODEL,
+            contents=numbered,
+            config=translation_config().model_copy(update={"system_instruction": system_instruction})
         )
-    )
-    return response.text.strip()
+    parts = BATCH_ITEM_RE.split(clean_response(response.text, numbered))
+    markers, results = parts[1::2], parts[2::2]
+    if parts[0].strip() or markers != [str(i) for i in range(1, len(texts) + 1)]:
+        return None
+    return [result.strip() for result in results]
 
-async def safe_translate_to_english(text: str, context: str, max_retries: int = 2) -> str:
-    """Wrapper for translate_to_english with retries and language verification."""
-    last_result = ""
-    for attempt in range(max_retries + 1):
+async def run_translation_batch(target: str, items: list):
+    """Resolves queued translations, falling back to one request per message if batching fails."""
+    results = None
+    if len(items) > 1:
         try:
-            result = await translate_to_english(text, context=context)
-        except Exception:
-            result = ""
-        if result and not is_japanese(result):
-            return result
-        last_result = result
-        await asyncio.sleep(1)
-    return last_result if last_result else "Translation error."
-
-async def safe_translate_to_japanese(text: str, context: str, max_retries: int = 2) -> str:
-    """Wrapper for translate_to_japanese with retries and language verification."""
+            results = await batch_translate([text for text, _, _ in items], merge_contexts([context for _, context, _ in items]), target)
+        except Exception as e:
+            print(f"Batch translation error: {e}")
+    if results is None:
+        results = await asyncio.gather(*(translate(text, target, context=context) for text, context, _ in items), return_exceptions=True)
+    for (_, _, future), result in zip(items, results):
+        if future.done():
+            continue
+        if isinstance(result, BaseException):
+            future.set_exception(result)
+        else:
+            future.set_result(result)
+
+async def translation_batch_worker(target: str, channel_id: int):
+    """Collects a channel's queued translation requests into batches and dispatches them."""
+    queue = translation_queues[(target, channel_id)]
+    loop = asyncio.get_running_loop()
+    while True:
+        items = [await queue.get()]
+        deadline = loop.time() + BATCH_WINDOW
+        while len(items) < BATCH_MAX_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        asyncio.create_task(run_translation_batch(target, items))
+
+async def queue_translation(target: str, text: str, context: str, channel_id: int = None) -> str:
+    """Queues a translation for its channel's batch worker, or translates directly if there is none."""
+    queue = translation_queues.get((target, channel_id))
+    if queue is None:
+        return await translate(text, target, context=context)
+    future = asyncio.get_running_loop().create_future()
+    await queue.put((text, context, future))
+    return await future
+
+# Exponential backoff between retries after API errors
+RETRY_BASE_DELAY = 0.1
+
+# Longer backoff when Gemini reports quota exhaustion (HTTP 429)
+RATE_LIMIT_MAX_DELAY = 30
+
+def retry_after(exc: Exception) -> float:
+    """Returns the retryDelay (seconds) suggested by a Gemini 429 error, or 0 if none is given."""
+    details = getattr(exc, "details", None)
+    if isinstance(details, dict):
+        error = details.get("error", details)
+        details = error.get("details") if isinstance(error, dict) else None
+    if not isinstance(details, list):
+        return 0
+    for item in details:
+        if isinstance(item, dict) and "retryDelay" in item:
+            try:
+                return float(str(item["retryDelay"]).rstrip("s"))
+            except ValueError:
+                return 0
+    return 0
+
+def retry_delay(attempt: int, exc: Exception = None) -> float:
+    """Returns a jittered exponential backoff delay for the given retry attempt."""
+    if getattr(exc, "code", None) == 429:
+        suggested = retry_after(exc)
+        if suggested:
+            return min(RATE_LIMIT_MAX_DELAY, suggested) + random.random()
+        return min(RATE_LIMIT_MAX_DELAY, 2 ** attempt) + random.random()
+    return RETRY_BASE_DELAY * (2 ** attempt) + random.uniform(0, RETRY_BASE_DELAY)
+
+def translation_cache_key(text: str) -> str:
+    """Normalizes whitespace so trivially different repeats ("OK", " OK\n") share a cache entry; case is kept ("US" vs "us")."""
+    return " ".join(text.split())
+
+def claim_translation(cache: LRUDict, key: str):
+    """Returns (future, is_owner) for a cache key; the owner must resolve the future."""
+    future = cache.get(key)
+    if future is not None:
+        cache.move_to_end(key)
+        return future, False
+    future = asyncio.get_running_loop().create_future()
+    cache[key] = future
+    return future, True
+
+def release_translation(cache: LRUDict, key: str, future: asyncio.Future, fallback: str):
+    """Resolves an unvalidated translation and drops it so it is not served from cache."""
+    if future.done():
+        return
+    if cache.get(key) is future:
+        del cache[key]
+    future.set_result(fallback)
+
+async def safe_translate(text: str, context: str, expected_lang: str, channel_id: int = None, max_retries: int = 2) -> str:
+    """Translates text into expected_lang ("en" or "ja") with retries, language verification and caching."""
+    if not needs_translation(text):
+        return text
+    cache = translation_caches[expected_lang]
+    fallback = TRANSLATION_ERRORS[expected_lang]
+    key = translation_cache_key(text)
+    future, is_owner = claim_translation(cache, key)
+    if not is_owner:
+        return await asyncio.shield(future)
     last_result = ""
-    for attempt in range(max_retries + 1):
-        try:
-            result = await translate_to_japanese(text, context=context)
-        except Exception:
-            result = ""
-        if result and is_japanese(result):
-            return result
-        last_result = result
-        await asyncio.sleep(1)
-    return last_result if last_result else "Translation error (JP)."
+    try:
+        strict = False
+        for attempt in range(max_retries + 1):
+            try:
+                if strict:
+                    result = await translate(text, expected_lang, context=context, strict=True)
+                else:
+                    result = await queue_translation(expected_lang, text, context, channel_id)
+            except Exception as e:
+                # API failure: back off before retrying, longer if rate limited
+                if attempt < max_retries:
+                    await asyncio.sleep(retry_delay(attempt, e))
+                continue
+            if result and is_japanese(result) == (expected_lang == "ja"):
+                future.set_result(result)
+                return result
+            last_result = result
+            if strict:
+                break
+            # Wrong language: retry once immediately with a stricter prompt
+            strict = True
+        return last_result if last_result else fallback
+    finally:
+        release_translation(cache, key, future, last_result if last_result else fallback)
 
 # --- LM Studio Comparison Logic ---
 
+# Shared HTTP session for LM Studio (keep-alive), created in setup_hook and closed with the bot
+lm_session = None
+LM_TIMEOUT = aiohttp.ClientTimeout(total=120)
+
+def get_lm_session() -> aiohttp.ClientSession:
+    """Returns the shared LM Studio session, creating it if needed."""
+    global lm_session
+    if lm_session is None or lm_session.closed:
+        lm_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=8, keepalive_timeout=75))
+    return lm_session
+
+def dump_json(payload: dict) -> bytes:
+    """Serializes a request payload, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload).encode('utf-8')
+
 async def query_lm_studio(model: str, messages: list) -> str:
     """Calls the OpenAI-compatible API of LM Studio."""
-    params = LM_MODEL_PARAMS.get(model, {"temperature": 0.7, "top_p": 0.9})
-    
-    async with aiohttp.ClientSession() as session:
-        payload = {
-            "model": model,
-            "messages": messages,
-            "temperature": params["temperature"],
-            "top_p": params["top_p"],
-        }
+    base = LM_PAYLOAD_BASE.get(model) or {"model": model, **LM_DEFAULT_PARAMS}
+    body = dump_json({**base, "messages": messages})
+    # Only the request itself is serialized (VRAM conservation); payload building overlaps
+    async with lm_semaphore:
+        print(f"Querying {model}...")
         try:
-            async with session.post(LM_STUDIO_URL, json=payload, timeout=120) as resp:
+            async with get_lm_session().post(LM_STUDIO_URL, data=body, headers=JSON_HEADERS, timeout=LM_TIMEOUT) as resp:
                 if resp.status == 200:
                     data = await resp.json()
                     return data['choices'][0]['message']['content'].strip()
@@ -177,6 +532,63 @@ async def query_lm_studio(model: str, messages: list) -> str:
                     return f"Error: {resp.status}"
         except Exception as e:
             return f"Error: {e}"
+        finally:
+            print(f"Finished {model}.")
+            if LM_COOLDOWN_SEC > 0:
+                await asyncio.sleep(LM_COOLDOWN_SEC)
+
+# Votes are buffered and written every LOG_FLUSH_INTERVAL seconds or once LOG_BATCH_SIZE are pending
+LOG_FLUSH_INTERVAL = 5
+LOG_BATCH_SIZE = 50
+comparison_log_buffer = []
+
+# Single worker thread keeps file writes off the event loop and in order
+log_executor = ThreadPoolExecutor(max_workers=1)
+
+# Log file handle kept open in append mode for the lifetime of the process
+comparison_log_handle = None
+comparison_log_csv = None
+
+def write_comparison_rows(rows: list):
+    """Appends rows to the comparison log file, opening it on first use."""
+    global comparison_log_handle, comparison_log_csv
+    try:
+        if comparison_log_handle is None:
+            comparison_log_handle = open(COMPARISON_LOG_PATH, 'a', buffering=1 << 16, newline='', encoding='utf-8')
+            comparison_log_csv = csv.writer(comparison_log_handle)
+        comparison_log_csv.writerows(rows)
+        comparison_log_handle.flush()
+    except Exception as e:
+        print(f"Logging error: {e}")
+
+def take_comparison_rows() -> list:
+    """Removes and returns all buffered comparison votes."""
+    rows = comparison_log_buffer[:]
+    comparison_log_buffer.clear()
+    return rows
+
+async def flush_comparison_log():
+    """Writes all buffered comparison votes in the logging thread."""
+    rows = take_comparison_rows()
+    if rows:
+        await asyncio.get_running_loop().run_in_executor(log_executor, write_comparison_rows, rows)
+
+def close_comparison_log():
+    """Writes any remaining buffered votes and closes the log file (used at exit)."""
+    rows = take_comparison_rows()
+    if rows:
+        write_comparison_rows(rows)
+    if comparison_log_handle is not None:
+        comparison_log_handle.close()
+
+# Don't lose buffered votes when the process exits
+atexit.register(close_comparison_log)
+
+async def comparison_log_flusher():
+    """Periodically flushes buffered comparison votes."""
+    while True:
+        await asyncio.sleep(LOG_FLUSH_INTERVAL)
+        await flush_comparison_log()
 
 class ComparisonView(discord.ui.View):
     """View class for A/B testing voting panel."""
@@ -190,14 +602,10 @@ class ComparisonView(discord.ui.View):
         self.message_id = message_id
 
     async def log_result(self, interaction: discord.Interaction, selection: str, winner_model: str):
-        filepath = os.path.join(BASE_DIR, COMPARISON_LOG_FILE)
         timestamp = datetime.datetime.now().isoformat()
-        try:
-            with open(filepath, 'a', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow([timestamp, self.source_channel_id, self.message_id, self.model_a_name, self.model_b_name, selection, winner_model])
-        except Exception as e:
-            print(f"Logging error: {e}")
+        comparison_log_buffer.append([timestamp, self.source_channel_id, self.message_id, self.model_a_name, self.model_b_name, selection, winner_model])
+        if len(comparison_log_buffer) >= LOG_BATCH_SIZE:
+            await flush_comparison_log()
 
         await interaction.response.send_message(f"Thanks for voting! (Selected: {selection})", ephemeral=True)
         try:
@@ -221,48 +629,35 @@ class ComparisonView(discord.ui.View):
     async def button_unknown(self, interaction: discord.Interaction, button: discord.ui.Button):
         await self.log_result(interaction, "Unknown", "N/A")
 
-async def run_comparison_task(message: discord.Message, context: str):
+LM_PROMPTS = {
+    target: (
+        "You are a professional translator.\n"
+        "### Conversation Context (DO NOT TRANSLATE):\n"
+        "--- CONTEXT START ---\n{context}\n--- CONTEXT END ---\n\n"
+        "### Translation Instructions:\n"
+        f"Translate the following text into professional {language} using the above context as a guide.\n"
+        "Keep Discord emojis and mentions intact.\n"
+        "Output ONLY the translation."
+    )
+    for target, language in TARGET_LANGUAGES.items()
+}
+
+async def run_comparison_task(message: discord.Message, context: str, text_is_japanese: bool):
     """Executes translations using LM Studio models and displays the voting panel."""
     original_text = message.content
-    target_language = "English" if is_japanese(original_text) else "Japanese"
-    
-    if target_language == "English":
-        system_instruction = (
-            "You are a professional translator.\n"
-            "### Conversation Context (DO NOT TRANSLATE):\n"
-            f"--- CONTEXT START ---\n{context}\n--- CONTEXT END ---\n\n"
-            "### Translation Instructions:\n"
-            "Translate the following text into professional English using the above context as a guide.\n"
-            "Keep Discord emojis and mentions intact.\n"
-            "Output ONLY the translation."
-        )
-    else:
-        system_instruction = (
-            "You are a professional translator.\n"
-            "### Conversation Context (DO NOT TRANSLATE):\n"
-            f"--- CONTEXT START ---\n{context}\n--- CONTEXT END ---\n\n"
-            "### Translation Instructions:\n"
-            "Translate the following text into professional Japanese using the above context as a guide.\n"
-            "Keep Discord emojis and mentions intact.\n"
-            "Output ONLY the translation."
-        )
+    system_instruction = LM_PROMPTS["en" if text_is_japanese else "ja"].format(context=context)
 
     messages = [
         {"role": "system", "content": system_instruction},
         {"role": "user", "content": original_text}
     ]
 
-    translations = {}
-
-    # Sequential execution to save VRAM
-    async with lm_lock:
-        print(f"Starting comparison for message {message.id}...")
-        for model in LM_MODELS:
-            print(f"Querying {model}...")
-            result = await query_lm_studio(model, messages)
-            translations[model] = result
-            print(f"Finished {model}.")
-            await asyncio.sleep(1)
+    print(f"Starting comparison for message {message.id}...")
+    results = await asyncio.gather(*(query_lm_studio(model, messages) for model in LM_MODELS), return_exceptions=True)
+    translations = {
+        model: f"Error: {result}" if isinstance(result, BaseException) else result
+        for model, result in zip(LM_MODELS, results)
+    }
 
     models = list(translations.keys())
     if len(models) < 2:
@@ -299,140 +694,239 @@ class SuggestReplyView(discord.ui.View):
         )
 
         try:
-            response = await async_client.models.generate_content(
-                model="gemini-3-flash-preview",
-                contents="Generate a reply suggestion.",
-                config=GenerateContentConfig(
-                    system_instruction=system_instruction,
-                    temperature=0.7, 
-                    candidate_count=1,
-                    thinking_config=ThinkingConfig(include_thoughts=False)
+            async with gemini_limiter, gemini_semaphore:
+                response = await get_gemini().models.generate_content(
+                    model=GEMINI_MODEL,
+                    contents="Generate a reply suggestion.",
+                    config=translation_config().model_copy(update={"system_instruction": system_instruction, "temperature": 0.7})
                 )
-            )
             suggestion = response.text.strip()
         except Exception as e:
             suggestion = f"Generation error: {e}"
 
         await interaction.followup.send(content=f"💡 **Reply Suggestion (Gemini-3 Flash)**:\n\n{suggestion}", ephemeral=True)
 
+# Prevents forwarded and edited messages from sending unwanted notifications
+ALLOWED_MENTIONS = discord.AllowedMentions(users=False, replied_user=False)
+
+class TranslationBot(commands.Bot):
+    """Bot that sets up its background workers and shared HTTP session once, and releases them on shutdown."""
+    async def setup_hook(self):
+        get_lm_session()
+
+        # Batch translation workers, one per source channel and target language
+        for channel_id in CHANNEL_ROUTES:
+            for target in TARGET_LANGUAGES:
+                translation_queues[(target, channel_id)] = asyncio.Queue()
+                asyncio.create_task(translation_batch_worker(target, channel_id))
+
+        asyncio.create_task(comparison_log_flusher())
+
+    async def close(self):
+        if lm_session is not None:
+            await lm_session.close()
+        await flush_comparison_log()
+        await super().close()
+
 intents = discord.Intents.default()
 intents.message_content = True
-bot = commands.Bot(command_prefix="!", intents=intents)
+bot = TranslationBot(command_prefix="!", intents=intents)
 
 # Map for suggestion messages: channel_id -> message object
 suggestion_messages = {}
 
+# Resolved target channel objects: source channel_id -> target channel
+resolved_targets = {}
+
+def resolve_target_channels():
+    """Resolves the target channel of every paired source channel."""
+    for source_id, (target_id, _) in CHANNEL_ROUTES.items():
+        resolved_targets[source_id] = bot.get_channel(target_id)
+
+def get_target_channel(source_channel_id: int, target_channel_id: int):
+    """Returns the resolved target channel, looking it up again if it wasn't available at startup."""
+    channel = resolved_targets.get(source_channel_id)
+    if channel is None:
+        channel = bot.get_channel(target_channel_id)
+        resolved_targets[source_channel_id] = channel
+    return channel
+
+async def cache_channel_history(channel_id: int):
+    """Loads the recent history of a monitored channel into conversation memory."""
+    channel = bot.get_channel(channel_id)
+    if not channel:
+        return
+    try:
+        history = []
+        async for msg in channel.history(limit=CONVERSATION_HISTORY_SIZE):
+            if not msg.author.bot:
+                history.append((msg.id, format_memory_line(msg)))
+        # Cache in chronological order
+        conversation_memory[channel_id] = deque(reversed(history), maxlen=CONVERSATION_HISTORY_SIZE)
+        context_cache.pop(channel_id, None)
+        print(f"Cached {len(history)} messages for channel {channel.name} ({channel_id})")
+    except Exception as e:
+        print(f"Failed to cache history for channel {channel_id}: {e}")
+
 @bot.event
 async def on_ready():
     print(f"Bot is ready. Logged in as {bot.user}")
+    if not GEMINI_API_KEY:
+        print("Error: Gemini API key is not configured. Translations will fail.")
+    resolve_target_channels()
     
-    # Cache conversation history for all monitored channels
-    target_channels = set(CHANNEL_JA_EN_PAIRS.keys()) | set(CHANNEL_EN_JA.keys())
+    # Cache conversation history for all monitored channels concurrently
     print("Caching conversation history...")
-    for channel_id in target_channels:
-        channel = bot.get_channel(channel_id)
-        if not channel:
-            continue
-        try:
-            history = []
-            async for msg in channel.history(limit=10):
-                if not msg.author.bot:
-                     history.append(f"{msg.author.display_name}: {msg.content}")
-            # Cache in chronological order
-            conversation_memory[channel_id] = history[::-1]
-            print(f"Cached {len(history)} messages for channel {channel.name} ({channel_id})")
-        except Exception as e:
-            print(f"Failed to cache history for channel {channel_id}: {e}")
+    await asyncio.gather(*(cache_channel_history(channel_id) for channel_id in CHANNEL_ROUTES))
     print("Conversation history cached.")
 
+@bot.event
+async def on_guild_channel_update(before, after):
+    # Refresh cached channel objects when a paired channel changes
+    if after.id in CHANNEL_ROUTES:
+        resolve_target_channels()
+
+def get_partial_message(channel_id: int, message_id: int):
+    """Returns a PartialMessage that can be edited or deleted without fetching the full message."""
+    channel = bot.get_channel(channel_id)
+    if channel is None:
+        return None
+    return channel.get_partial_message(message_id)
+
 def build_forward_content(message: discord.Message, translated_text: str) -> str:
     """Builds the content for the forwarded message including image links."""
-    header = f"__**{message.author.mention}**__\n"
-    content = header + translated_text if translated_text else header
-    image_links = []
-    for attachment in message.attachments:
-        if attachment.content_type and attachment.content_type.startswith("image"):
-            image_links.append(attachment.url)
-    if image_links:
-        content += "\n" + "\n".join(image_links)
-    return content
+    parts = [f"__**{message.author.mention}**__"]
+    if translated_text:
+        parts.append(translated_text)
+    parts.extend(
+        attachment.url for attachment in message.attachments
+        if attachment.content_type and attachment.content_type.startswith("image")
+    )
+    return "\n".join(parts)
+
+def route_language(text: str, target_lang: str, text_is_japanese: bool = None):
+    """Returns the language ("en" or "ja") text must be translated into for a route, or None if it is forwarded as is."""
+    if not needs_translation(text):
+        return None
+    if text_is_japanese is None:
+        text_is_japanese = is_japanese(text)
+    expected_lang = "en" if text_is_japanese else "ja"
+    if target_lang != "auto" and target_lang != expected_lang:
+        # Already in the target language
+        return None
+    return expected_lang
+
+async def translate_for_route(text: str, target_lang: str, context: str, channel_id: int = None, text_is_japanese: bool = None) -> str:
+    """Translates text for a channel route whose target language is "en", "ja" or "auto"."""
+    expected_lang = route_language(text, target_lang, text_is_japanese)
+    if expected_lang is None:
+        return text
+    try:
+        return await safe_translate(text, context, expected_lang, channel_id)
+    except Exception:
+        return TRANSLATION_ERRORS[expected_lang]
+
+# Discord allows about 5 edits per 5 seconds, so streamed translations are shown at most once per interval
+STREAM_EDIT_INTERVAL = 1.0
+STREAM_PLACEHOLDER = "…"
+
+async def stream_forwarded_translation(message: discord.Message, forwarded: discord.Message, expected_lang: str, context: str):
+    """Fills a placeholder forwarded message with a streamed translation, then caches the verified result."""
+    loop = asyncio.get_running_loop()
+    received = shown = ""
+
+    def on_progress(text: str):
+        nonlocal received
+        received = text
+
+    async def show_progress():
+        # Runs beside the stream so Discord edits never hold a Gemini slot
+        nonlocal shown
+        while True:
+            await asyncio.sleep(STREAM_EDIT_INTERVAL)
+            partial = clean_response(received, message.content)
+            if not partial or partial == shown:
+                continue
+            try:
+                await forwarded.edit(content=build_forward_content(message, partial), allowed_mentions=ALLOWED_MENTIONS)
+                shown = partial
+            except Exception as e:
+                print("Edit error:", e)
+
+    progress_task = asyncio.create_task(show_progress())
+    try:
+        translated = await translate_stream(message.content, expected_lang, context, on_progress)
+    except Exception as e:
+        print("Streaming translation error:", e)
+        translated = ""
+    finally:
+        # Wait for an in-flight progress edit so it can't land after the final one
+        progress_task.cancel()
+        await asyncio.gather(progress_task, return_exceptions=True)
+    translated = clean_response(translated, message.content)
+    if translated and is_japanese(translated) == (expected_lang == "ja"):
+        cache = translation_caches[expected_lang]
+        key = translation_cache_key(message.content)
+        if key not in cache:
+            future = loop.create_future()
+            future.set_result(translated)
+            cache[key] = future
+    else:
+        # Failed or wrong language: fall back to the retrying, validated path
+        translated = await translate_for_route(message.content, expected_lang, context, message.channel.id)
+    if translated == shown:
+        return
+    try:
+        await forwarded.edit(content=build_forward_content(message, translated), allowed_mentions=ALLOWED_MENTIONS)
+    except Exception as e:
+        print("Edit error:", e)
 
 async def forward_message(message: discord.Message) -> discord.Message:
     """Processes and forwards a message to the linked channel."""
     source_channel_id = message.channel.id
-    # Update memory
-    conversation_memory.setdefault(source_channel_id, [])
-    conversation_memory[source_channel_id].append(f"{message.author.display_name}: {message.content}")
-    conversation_memory[source_channel_id] = conversation_memory[source_channel_id][-10:]
-    
-    # Self-mapping (internal translation within the same channel)
-    if source_channel_id in CHANNEL_JA_EN_PAIRS and CHANNEL_JA_EN_PAIRS[source_channel_id] == source_channel_id:
-        target_channel = message.channel
-        if message.content:
-            context = get_conversation_context(source_channel_id)
-            if is_japanese(message.content):
-                try:
-                    translated = await safe_translate_to_english(message.content, context=context)
-                except Exception:
-                    translated = "Translation error."
-            else:
-                try:
-                    translated = await safe_translate_to_japanese(message.content, context=context)
-                except Exception:
-                    translated = "Translation error (JP)."
-        else:
-            translated = ""
-    # Standard forward (Japanese -> English)
-    elif source_channel_id in CHANNEL_JA_EN_PAIRS:
-        target_channel = bot.get_channel(CHANNEL_JA_EN_PAIRS[source_channel_id])
-        if message.content:
-            if is_japanese(message.content):
-                context = get_conversation_context(source_channel_id)
-                try:
-                    translated = await safe_translate_to_english(message.content, context=context)
-                except Exception:
-                    translated = "Translation error."
-            else:
-                translated = message.content
-        else:
-            translated = ""
-    # English -> Japanese forward
-    elif source_channel_id in CHANNEL_EN_JA:
-        target_channel = bot.get_channel(CHANNEL_EN_JA[source_channel_id])
-        if message.content:
-            if not is_japanese(message.content):
-                context = get_conversation_context(source_channel_id)
-                try:
-                    translated = await safe_translate_to_japanese(message.content, context=context)
-                except Exception:
-                    translated = "Translation error (JP)."
-            else:
-                translated = message.content
-        else:
-            translated = ""
-    else:
+    route = CHANNEL_ROUTES.get(source_channel_id)
+    if route is None:
         return None
+    target_channel_id, target_lang = route
+    target_channel = get_target_channel(source_channel_id, target_channel_id)
+    if target_channel is None:
+        return None
+    context = get_conversation_context(source_channel_id)
+
+    # Start A/B testing first so LM Studio runs while Gemini translates
+    text_is_japanese = None
+    if ENABLE_COMPARISON and message.content:
+        text_is_japanese = is_japanese(message.content)
+        asyncio.create_task(run_comparison_task(message, context, text_is_japanese))
+
+    stream_lang = None
+    if ENABLE_STREAMING:
+        stream_lang = route_language(message.content, target_lang, text_is_japanese)
+        if translation_cache_key(message.content) in translation_caches.get(stream_lang, ()):
+            # Cached translations are already instant
+            stream_lang = None
+    if stream_lang:
+        translated = STREAM_PLACEHOLDER
+    else:
+        translated = await translate_for_route(message.content, target_lang, context, source_channel_id, text_is_japanese)
 
     ref = None
     if message.reference and message.reference.message_id:
         key = (source_channel_id, message.reference.message_id)
         if key in forward_map:
-            ref = forward_map[key]
-
-    if ref is not None and ref.channel.id != target_channel.id:
-        ref = None
+            ref_channel_id, ref_message_id = forward_map[key]
+            if ref_channel_id == target_channel.id:
+                ref = target_channel.get_partial_message(ref_message_id)
 
     content_to_send = build_forward_content(message, translated)
     
-    allowed_mentions = discord.AllowedMentions(
-        users=False,
-        replied_user=False
-    )
-    
-    forwarded = await target_channel.send(content=content_to_send, reference=ref, mention_author=False, allowed_mentions=allowed_mentions)
+    forwarded = await target_channel.send(content=content_to_send, reference=ref, mention_author=False, allowed_mentions=ALLOWED_MENTIONS)
+
+    forward_map[(source_channel_id, message.id)] = (target_channel.id, forwarded.id)
+    forward_map[(target_channel.id, forwarded.id)] = (source_channel_id, message.id)
 
-    forward_map[(source_channel_id, message.id)] = forwarded
-    forward_map[(target_channel.id, forwarded.id)] = message
+    if stream_lang:
+        await stream_forwarded_translation(message, forwarded, stream_lang, context)
 
     # Send suggestion button (deletes after 30s)
     if message.content:
@@ -450,10 +944,6 @@ async def forward_message(message: discord.Message) -> discord.Message:
         except Exception as e:
             print(f"Failed to send suggestion message: {e}")
 
-    # Start A/B testing task if enabled
-    if ENABLE_COMPARISON and message.content:
-         asyncio.create_task(run_comparison_task(message, context if 'context' in locals() else get_conversation_context(source_channel_id)))
-
     return forwarded
 
 @bot.event
@@ -468,108 +958,132 @@ async def on_message(message: discord.Message):
                 pass
             del suggestion_messages[message.channel.id]
 
-    if message.channel.id in CHANNEL_JA_EN_PAIRS or message.channel.id in CHANNEL_EN_JA:
-        forward_map[(message.channel.id, message.id)] = message
-        conversation_memory.setdefault(message.channel.id, [])
-        conversation_memory[message.channel.id].append(f"{message.author.display_name}: {message.content}")
-        conversation_memory[message.channel.id] = conversation_memory[message.channel.id][-10:]
+    is_routed = message.channel.id in CHANNEL_ROUTES
+    if is_routed:
+        forward_map[(message.channel.id, message.id)] = (message.channel.id, message.id)
+        remember_message(message)
     
     if message.author.bot:
         return
         
-    if message.channel.id in CHANNEL_JA_EN_PAIRS or message.channel.id in CHANNEL_EN_JA:
+    if is_routed:
         await forward_message(message)
     else:
         await bot.process_commands(message)
 
+# Seconds to wait for further edits before retranslating an edited message
+EDIT_DEBOUNCE_SEC = 1.5
+
+# Source message ID -> pending retranslation task
+edit_tasks = {}
+
+async def retranslate_edit(message: discord.Message, forwarded_msg: discord.PartialMessage):
+    """Retranslates an edited message once no newer edit has arrived for EDIT_DEBOUNCE_SEC."""
+    try:
+        await asyncio.sleep(EDIT_DEBOUNCE_SEC)
+        _, target_lang = CHANNEL_ROUTES[message.channel.id]
+        # Shielded so a newer edit cancels only the stale Discord edit, not a shared cached translation
+        translated = await asyncio.shield(translate_for_route(message.content, target_lang, get_conversation_context(message.channel.id), message.channel.id))
+        new_content = build_forward_content(message, translated)
+        try:
+            await forwarded_msg.edit(content=new_content, allowed_mentions=ALLOWED_MENTIONS)
+        except Exception as e:
+            print("Edit error:", e)
+    finally:
+        if edit_tasks.get(message.id) is asyncio.current_task():
+            del edit_tasks[message.id]
+
 @bot.event
 async def on_message_edit(before: discord.Message, after: discord.Message):
     if after.author.bot:
         return
+    # Embed unfurls and pin changes also fire edit events; nothing to retranslate
+    if before.content == after.content:
+        return
     source_channel_id = after.channel.id
-    if source_channel_id not in CHANNEL_JA_EN_PAIRS and source_channel_id not in CHANNEL_EN_JA:
+    if source_channel_id not in CHANNEL_ROUTES:
         return
     
-    conversation_memory.setdefault(source_channel_id, [])
-    conversation_memory[source_channel_id].append(f"{after.author.display_name}: {after.content}")
-    conversation_memory[source_channel_id] = conversation_memory[source_channel_id][-10:]
+    update_remembered_message(after)
     
     key = (source_channel_id, after.id)
     if key not in forward_map:
         return
-    forwarded_msg = forward_map[key]
-
-    # Process edits for self-mapping or paired channels
-    if source_channel_id in CHANNEL_JA_EN_PAIRS and CHANNEL_JA_EN_PAIRS[source_channel_id] == source_channel_id:
-        if after.content:
-            context = get_conversation_context(source_channel_id)
-            if is_japanese(after.content):
-                try:
-                    translated = await safe_translate_to_english(after.content, context=context)
-                except Exception:
-                    translated = "Translation error."
-            else:
-                try:
-                    translated = await safe_translate_to_japanese(after.content, context=context)
-                except Exception:
-                    translated = "Translation error (JP)."
-        else:
-            translated = ""
-    elif source_channel_id in CHANNEL_JA_EN_PAIRS:
-        if after.content:
-            if is_japanese(after.content):
-                context = get_conversation_context(source_channel_id)
-                try:
-                    translated = await safe_translate_to_english(after.content, context=context)
-                except Exception:
-                    translated = "Translation error."
-            else:
-                translated = after.content
-        else:
-            translated = ""
-    else:
-        if after.content:
-            if not is_japanese(after.content):
-                context = get_conversation_context(source_channel_id)
-                try:
-                    translated = await safe_translate_to_japanese(after.content, context=context)
-                except Exception:
-                    translated = "Translation error (JP)."
-            else:
-                translated = after.content
-        else:
-            translated = ""
-            
-    new_content = build_forward_content(after, translated)
-    
-    # Configure to prevent unwanted notifications
-    allowed_mentions = discord.AllowedMentions(
-        users=False,
-        replied_user=False
-    )
-    
-    try:
-        await forwarded_msg.edit(content=new_content, allowed_mentions=allowed_mentions)
-    except Exception as e:
-        print("Edit error:", e)
+    forwarded_msg = get_partial_message(*forward_map[key])
+    if forwarded_msg is None:
+        return
 
-@bot.event
-async def on_message_delete(message: discord.Message):
+    # Only the last of several quick edits is retranslated
+    pending = edit_tasks.pop(after.id, None)
+    if pending is not None:
+        pending.cancel()
+    edit_tasks[after.id] = asyncio.create_task(retranslate_edit(after, forwarded_msg))
+
+# Forwarded copies deleted within DELETE_BATCH_WINDOW seconds are removed with one bulk request per channel
+DELETE_BATCH_WINDOW = 0.5
+DELETE_BATCH_MAX_SIZE = 100
+
+# Target channel ID -> IDs of forwarded messages waiting to be deleted
+pending_deletes = {}
+
+def queue_forward_delete(channel_id: int, message_id: int):
+    """Schedules a forwarded message for deletion, starting a flush for its channel if none is pending."""
+    message_ids = pending_deletes.get(channel_id)
+    if message_ids is None:
+        message_ids = pending_deletes[channel_id] = []
+        asyncio.create_task(flush_forward_deletes(channel_id))
+    message_ids.append(message_id)
+
+async def flush_forward_deletes(channel_id: int):
+    """Deletes the queued forwarded messages of a channel, falling back to single deletes if bulk delete fails."""
+    await asyncio.sleep(DELETE_BATCH_WINDOW)
+    message_ids = pending_deletes.pop(channel_id, [])
+    channel = bot.get_channel(channel_id)
+    if channel is None:
+        return
+    messages = [channel.get_partial_message(message_id) for message_id in message_ids]
+    for i in range(0, len(messages), DELETE_BATCH_MAX_SIZE):
+        chunk = messages[i:i + DELETE_BATCH_MAX_SIZE]
+        if len(chunk) > 1:
+            try:
+                await channel.delete_messages(chunk)
+                continue
+            except Exception as e:
+                # Bulk delete needs Manage Messages and messages under 14 days old
+                print("Bulk delete error:", e)
+        results = await asyncio.gather(*(msg.delete() for msg in chunk), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                print("Delete error:", result)
+
+def delete_forwarded(message: discord.Message):
+    """Forgets a deleted source message and queues its forwarded copy for deletion."""
     if message.author.bot:
         return
     source_channel_id = message.channel.id
-    if source_channel_id not in CHANNEL_JA_EN_PAIRS and source_channel_id not in CHANNEL_EN_JA:
+    if source_channel_id not in CHANNEL_ROUTES:
         return
+    pending = edit_tasks.pop(message.id, None)
+    if pending is not None:
+        pending.cancel()
     
     key = (source_channel_id, message.id)
     if key in forward_map:
-        forwarded_msg = forward_map.pop(key)
-        key_target = (forwarded_msg.channel.id, forwarded_msg.id)
+        key_target = forward_map.pop(key)
         if key_target in forward_map:
             forward_map.pop(key_target)
-        try:
-            await forwarded_msg.delete()
-        except Exception as e:
-            print("Delete error:", e)
+        queue_forward_delete(*key_target)
+
+@bot.event
+async def on_message_delete(message: discord.Message):
+    delete_forwarded(message)
+
+@bot.event
+async def on_bulk_message_delete(messages: list):
+    for message in messages:
+        delete_forwarded(message)
+
+if uvloop is not None:
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 
 bot.run(TOKEN)